@@ -0,0 +1,60 @@
+#!python3
+
+# Loads the data saved by the 'ALTmotion - ver. 0.1.py' script for a "time slice":
+# the 'sSAD' and the 'motionEstimate' values of each frame
+# and the frame numbers and times of the detected motion.
+# Usage (prints a summary of the data):
+# python3 "ALTmotion - load data.py" <time slice folder>
+# and, to also save the data into the 'SADs.txt', 'motionEstimate.txt' and
+# 'motion detection times.txt' text files ("frame number: value" lines)
+# in the time slice folder:
+# python3 "ALTmotion - load data.py" <time slice folder> --text
+
+
+import numpy as np
+import os
+import sys
+
+
+def load_time_slice(timeSliceDir):
+
+    # The values of frame number i (counting from 1) are sSADs[i - 1] and motionEstimates[i - 1].
+    sSADs = np.load(os.path.join(timeSliceDir, 'SADs.npy'))
+    motionEstimates = np.load(os.path.join(timeSliceDir, 'motionEstimate.npy'))
+
+    # motionDetections['frame'] are the frame numbers,
+    # motionDetections['time'] are the times (ns since the epoch, see 'time.time_ns()').
+    motionDetections = np.load(os.path.join(timeSliceDir, 'motion detection times.npy'))
+
+    return sSADs, motionEstimates, motionDetections
+
+
+def save_time_slice_as_text(timeSliceDir):
+
+    sSADs, motionEstimates, motionDetections = load_time_slice(timeSliceDir)
+
+    # Note that 'tolist()' converts the values to Python integers,
+    # which the f-strings below format faster than NumPy ones.
+    with open(os.path.join(timeSliceDir, 'SADs.txt'), 'w') as sSADsfile:
+        sSADsfile.writelines(f'{i}: {sSAD}\n' for i, sSAD in enumerate(sSADs.tolist(), 1))
+
+    with open(os.path.join(timeSliceDir, 'motionEstimate.txt'), 'w') as motionEstimateFile:
+        motionEstimateFile.writelines(f'{i}: {motionEstimate}\n' for i, motionEstimate in enumerate(motionEstimates.tolist(), 1))
+
+    # frame number: time, s
+    with open(os.path.join(timeSliceDir, 'motion detection times.txt'), 'w') as motionDetectionTimesFile:
+        motionDetectionTimesFile.writelines(f'{frame}: {time // 1000000000}.{time % 1000000000:09d}\n'
+                                            for frame, time in zip(motionDetections['frame'].tolist(),
+                                                                   motionDetections['time'].tolist()))
+
+
+if __name__ == '__main__':
+
+    timeSliceDir = sys.argv[1]
+    sSADs, motionEstimates, motionDetections = load_time_slice(timeSliceDir)
+
+    print('frames: ', len(sSADs))
+    print('detected motion: ', len(motionDetections), ' frames')
+
+    if '--text' in sys.argv[2:]:
+        save_time_slice_as_text(timeSliceDir)
@@ -68,6 +68,16 @@ import picamera.array
 import time
 import datetime
 import os
+import queue
+import threading
+import ctypes
+
+try:
+    from numba import njit # Please see https://numba.readthedocs.io
+                           # The 'analyse' method below falls back to NumPy
+                           # when Numba is not installed.
+except ImportError:
+    njit = None
 
 
 experimentDurationHours = 0.05 # Duration of the data collection, hours.
@@ -84,6 +94,15 @@ motionDetectionThreshold = 1000 # Threshold for the 'motionEstimate' value (see
 								# Motion is considered to be detected when
 								# 'motionEstimate' > 'motionDetectionThreshold'.
 
+analysisBatchSize = 8 # Number of frames the NumPy version of the 'analyse' computations
+					  # processes at once (see below), 1 to process every frame on arrival.
+
+analyseCpuCore = 3 # CPU core (0-3 on Raspberry Pi 3B) the 'analyse' method runs on,
+				   # None to let it run on any core (see below).
+
+analyseRealtimePriority = 50 # 'SCHED_FIFO' real-time priority (1-99) of the 'analyse' method,
+							 # None for the default scheduling (see below).
+
 
 # Motion vector data array 'a' is a 45 rows x 81 columns array for 1280x720 frame size,
 # 30 rows x 41 columns array for 640x480 frame size.
@@ -97,28 +116,205 @@ motionDetectionThreshold = 1000 # Threshold for the 'motionEstimate' value (see
 # a signed 1-byte x vector, a signed 1-byte y vector,
 # and an unsigned 2-byte SAD (Sum of Absolute Differences) value for each macro-block"
 # (https://picamera.readthedocs.io/en/release-1.13/recipes2.html#recording-motion-vector-data).
-# Therefore, the 'columnsPerRow' value should be set according to the
+# Therefore, the 'rows' and 'columnsPerRow' values should be set according to the
 # 'camera.resolution = (..., ...)' setting (see below).
-## rows = 45
+rows = 45
 columnsPerRow = 81
 
 os.makedirs(experimentDir) # Error if the 'experimentDir' folder exists.
 
+# The NumPy version of the 'analyse' computations (see below) goes over the
+# motion vector data array several times: once for the 'sSAD' value,
+# once for each of the absolute values of the X-axis and Y-axis components
+# (allocating a temporary array for each of them), and once more for each of their sums.
+# The '_analyse_kernel' function reads each element of the array only once
+# and keeps the sums in scalar variables.
+# The positions (row, column) of the largest X-axis and Y-axis motion vector
+# components are only needed when motion is detected, which is why they are
+# found by the separate '_locate_kernel' function: the loop of the
+# '_analyse_kernel' function, run for every frame, has no branches.
+# The functions do not take the a['x'], a['y'] and a['sad'] arrays, which are
+# views with a stride of 4 bytes into the motion vector data array and whose stride
+# Numba only knows at run time. They take the same memory viewed as contiguous
+# 'int8' ('mvd') and 'uint16' ('sad') arrays instead (see the '_mvdViews' function below):
+# the X-axis and Y-axis components of the i-th element are mvd[4*i] and mvd[4*i + 1],
+# its SAD value is sad[2*i + 1]. With the fixed layout known at compile time,
+# the loops can load the data with vector instructions
+# (and separate the x, y and SAD values in the registers).
+# Note that Numba compiles the functions on their first call (or loads them from
+# its cache, see 'cache=True'), which is why the functions are called once
+# before the start of the video recording (see below).
+# The size of the motion vector data array is fixed by the 'rows' and 'columnsPerRow'
+# settings, which Numba treats as compile-time constants.
+# The '_analyse_kernel' function runs the loop of the '_sums' function
+# (inlined by Numba) with this constant number of elements,
+# which lets the compiler unroll the loop.
+if njit is not None:
+    @njit(inline='always', fastmath=True)
+    def _sums(mvd, sad, n):
+        sSAD = 0
+        XabsSum = 0
+        YabsSum = 0
+        for i in range(n):
+            sSAD += sad[2*i + 1]
+            XabsSum += abs(np.int32(mvd[4*i]))
+            YabsSum += abs(np.int32(mvd[4*i + 1]))
+        return sSAD, XabsSum, YabsSum
+
+    @njit(cache=True, fastmath=True)
+    def _analyse_kernel(mvd, sad):
+        if sad.size == 2*rows*columnsPerRow:
+            return _sums(mvd, sad, rows*columnsPerRow)
+        return _sums(mvd, sad, sad.size // 2)
+
+    # The '_locate_kernel' function finds the largest values first, using 'max'
+    # rather than branches (which the position of the largest value, random from
+    # frame to frame, would make unpredictable), then their first positions
+    # (as 'np.argmax' does).
+    @njit(cache=True, fastmath=True)
+    def _locate_kernel(mvd, columnsPerRow):
+        maxXabs = 0
+        maxYabs = 0
+        for i in range(mvd.size // 4):
+            maxXabs = max(maxXabs, abs(np.int32(mvd[4*i])))
+            maxYabs = max(maxYabs, abs(np.int32(mvd[4*i + 1])))
+        indexMaxXabs = 0
+        while abs(np.int32(mvd[4*indexMaxXabs])) != maxXabs:
+            indexMaxXabs += 1
+        indexMaxYabs = 0
+        while abs(np.int32(mvd[4*indexMaxYabs + 1])) != maxYabs:
+            indexMaxYabs += 1
+        return (indexMaxXabs // columnsPerRow, indexMaxXabs % columnsPerRow,
+                indexMaxYabs // columnsPerRow, indexMaxYabs % columnsPerRow)
+else:
+    _analyse_kernel = None
+    _locate_kernel = None
+
+def _mvdViews(a):
+
+    mvd = a.reshape(-1).view(np.int8)
+    return mvd, mvd.view(np.uint16)
+
+# The C (with NEON instructions) implementation of the '_analyse_kernel' and
+# '_locate_kernel' functions, see the 'altmotion_kernel.c' file for how to build it.
+# It is used instead of the Numba and NumPy versions of the 'analyse' computations
+# when the 'altmotion_kernel.so' file is found next to this script.
+# The C functions read the motion vector data array directly from its memory,
+# which picamera provides as a contiguous array.
+try:
+    _ckernel = ctypes.CDLL(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'altmotion_kernel.so'))
+except OSError:
+    _ckernel = None
+else:
+    _ckernel.altmotion_analyse.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p)
+    _ckernel.altmotion_analyse.restype = None
+    _ckernel.altmotion_locate.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.c_size_t, ctypes.c_void_p)
+    _ckernel.altmotion_locate.restype = None
+
+# Note that the motion vector data are produced by the GPU (VideoCore IV) of the
+# Raspberry Pi as a by-product of the H.264 encoding, and picamera copies them
+# from the GPU buffer into a 'bytes' object before calling the 'analyse' method.
+# The 'analyse' computations are not moved to the GPU: the VideoCore IV supports
+# OpenGL ES 2.0 only (no compute shaders), and picamera does not give access to
+# the buffer of the motion vector output.
+# For the 45 x 81 array (14580 bytes) the copy takes a small part of the time
+# between the frames; the computations above read the copied array only once per frame.
+
+# picamera calls the 'analyse' method from its own thread.
+# The '_pin_analyse_thread' function, called from that thread (see below),
+# pins it to the 'analyseCpuCore' CPU core and gives it the 'SCHED_FIFO' real-time
+# priority 'analyseRealtimePriority', so that other processes and threads
+# do not delay the analysis of the frames.
+# This works best when the CPU core is reserved for it by adding
+#   isolcpus=3 nohz_full=3
+# (for 'analyseCpuCore = 3') to the kernel command line in the /boot/cmdline.txt file
+# and rebooting: the Linux kernel then schedules other tasks on the other cores only.
+# Note that setting the 'SCHED_FIFO' priority requires running the script as root
+# (e.g. with 'sudo'); the analysis runs with the default scheduling otherwise.
+def _pin_analyse_thread():
+
+    if analyseCpuCore is not None:
+        try:
+            os.sched_setaffinity(0, {analyseCpuCore})
+        except OSError as e:
+            print("Could not set the CPU core of the 'analyse' thread: ", e)
+
+    if analyseRealtimePriority is not None:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(analyseRealtimePriority))
+        except OSError as e:
+            print("Could not set the priority of the 'analyse' thread: ", e)
+
 # See https://picamera.readthedocs.io/en/release-1.13/api_array.html#pimotionanalysis
 # for the 'picamera.array.PiMotionAnalysis' class documentation.
 class mmotion(picamera.array.PiMotionAnalysis):
 
-    def analyse(self, a):
+    def __init__(self, camera, size = None):
+
+        super(mmotion, self).__init__(camera, size)
+
+        self._analyseThread = None # See the '_pin_analyse_thread' function above.
+
+        # Arrays the C functions (see above) store their results into.
+        if _ckernel is not None:
+            self._sums = np.zeros(3, dtype = np.uint32)
+            self._sumsAddress = self._sums.ctypes.data
+            self._positions = np.zeros(4, dtype = np.uint32)
+            self._positionsAddress = self._positions.ctypes.data
+
+        # The NumPy version of the 'analyse' computations processes
+        # 'analysisBatchSize' frames at once (see the '_analyse_batch' method below):
+        # each NumPy call has an overhead comparable to the time it takes
+        # to process a single 45 x 81 array, which the batches share.
+        # '_batch' holds the motion vector data arrays of the frames of a batch,
+        # '_batchTimes' the times they were received at.
+        # '_xyabs' is the array for the absolute values of the X-axis ('_xyabs[:, 0]')
+        # and Y-axis ('_xyabs[:, 1]') motion vector components of the frames.
+        # The arrays are allocated once and reused for every batch.
+        # Note that a 'uint8' (rather than 'int8') array holds the absolute value
+        # of -128 correctly (see the "casting = 'unsafe'" argument below).
+        elif _analyse_kernel is None:
+            self._batch = np.empty((analysisBatchSize, rows*columnsPerRow), dtype = picamera.array.motion_dtype)
+            self._batchTimes = np.empty(analysisBatchSize, dtype = np.int64)
+            self._xyabs = np.empty((analysisBatchSize, 2, rows*columnsPerRow), dtype = np.uint8)
+
+        self._batchSize = 0 # Number of frames in the '_batch' array.
 
-        global currentFrame
+    def analyse(self, a):
 
-        analysisStartTime = time.time()
+        global currentFrame, motionDetectionCount
+
+        if threading.get_ident() != self._analyseThread:
+            self._analyseThread = threading.get_ident()
+            _pin_analyse_thread()
+
+        # NumPy version: the frame is only copied into the '_batch' array here
+        # and analysed with the other frames of its batch (see '_analyse_batch' below).
+        if _ckernel is None and _analyse_kernel is None:
+            self._batch[self._batchSize] = a.reshape(-1)
+            self._batchTimes[self._batchSize] = time.time_ns()
+            self._batchSize += 1
+            if self._batchSize == analysisBatchSize:
+                self._analyse_batch()
+            return
+
+        # Note that the integer 'time.monotonic_ns()' and 'time.time_ns()' clocks
+        # (nanoseconds) are used below instead of the floating point 'time.time()' one.
+        analysisStartTime = time.monotonic_ns()
+
+        # 'sSAD' is the 'sSAD' value referred to in the
+        # https://github.com/lvetech/ALT/blob/master/README.md file.
+        # 'XabsSum' and 'YabsSum' are the sums of the absolute values of the
+        # X-axis and Y-axis motion vector components.
+        if _ckernel is not None:
+            _ckernel.altmotion_analyse(a.ctypes.data, a.size, self._sumsAddress)
+            sSAD, XabsSum, YabsSum = self._sums.tolist()
+        else:
+            mvd, sad = _mvdViews(a)
+            sSAD, XabsSum, YabsSum = _analyse_kernel(mvd, sad)
 
 #sSAD:
-        #This is the 'sSAD' value referred to in the
-        # https://github.com/lvetech/ALT/blob/master/README.md file:
-        sSAD = np.sum(a['sad'])
-        sSADs.append(sSAD)
+        sSADs[currentFrame - 1] = sSAD
 
         # Note that both the 'sSAD' and the 'motionEstimate' values
         # for an I-frame in the captured video data stream will be equal to zero.
@@ -142,18 +338,9 @@ class mmotion(picamera.array.PiMotionAnalysis):
                 #sSADsNoZeros.append(sSADsNoZeros[-1])
 
 #MOTION:
-        Xabs = np.absolute(a['x']) # Calculate the absolute values of the
-        						   # X-axis motion vector components
-
-        Yabs = np.absolute(a['y']) # Calculate the absolute values of the
-        						   # Y-axis motion vector components
-
-        XabsSum = np.sum(Xabs)
-        YabsSum = np.sum(Yabs)
-
     	# Estimate of the "amount of motion" in the frame:
         motionEstimate = XabsSum + YabsSum
-        motionEstimates.append(motionEstimate)
+        motionEstimates[currentFrame - 1] = motionEstimate
 
 # Uncomment for test purposes only!
         #print('motionEstimate = ', motionEstimate)
@@ -167,31 +354,26 @@ class mmotion(picamera.array.PiMotionAnalysis):
 
 
         if motionEstimate > motionDetectionThreshold:
-            motionDetectionTime = time.time()
-            motionDetectionTimes.append(motionDetectionTime)
-            motionDetectionFrameNumbers.append(currentFrame)
+            motionDetectionTime = time.time_ns()
+            motionDetectionTimes[motionDetectionCount] = motionDetectionTime
+            motionDetectionFrameNumbers[motionDetectionCount] = currentFrame
+            motionDetectionCount += 1
 
         # We find the element of the motion vector data array which has the
         # motion vector with the largest X-axis component, and
         # the element of the motion vector data array which has the
         # motion vector with the largest Y-axis component below.
 
-            indexMaxXabs = np.argmax(Xabs)
-            indexMaxYabs = np.argmax(Yabs)
-
-        # position (row, column) in the motion vector data array of the element having the
-        # motion vector with the largest X-axis component:
-            rowForMaxXabs = int(indexMaxXabs/columnsPerRow)
-            columnForMaxXabs = indexMaxXabs - rowForMaxXabs*columnsPerRow
-        # position (row, column) in the motion vector data array of the element having the
-        # motion vector with the largest Y-axis component:
-            rowForMaxYabs = int(indexMaxYabs/columnsPerRow)
-            columnForMaxYabs = indexMaxYabs - rowForMaxYabs*columnsPerRow
+            if _ckernel is not None:
+                _ckernel.altmotion_locate(a.ctypes.data, a.size, columnsPerRow, self._positionsAddress)
+                rowForMaxXabs, columnForMaxXabs, rowForMaxYabs, columnForMaxYabs = self._positions.tolist()
+            else:
+                rowForMaxXabs, columnForMaxXabs, rowForMaxYabs, columnForMaxYabs = _locate_kernel(mvd, columnsPerRow)
 
-            analysisStopTime = time.time()
+            analysisStopTime = time.monotonic_ns()
 
             # The "motion detected" path
-            # (the code between the 'analysisStartTime' and 'analysisStopTime', lines 115-191 above)
+            # (the code between the 'analysisStartTime' and 'analysisStopTime' above)
             # is quite fast, taking
             # less than 1 ms on a Raspberry Pi 3B unit to complete with the
             # 'camera.resolution = (1280, 720)' setting (see below).
@@ -202,14 +384,148 @@ class mmotion(picamera.array.PiMotionAnalysis):
             # code which is "execution time -sensitive".
 
 # Uncomment for test purposes only!
-#            print("'analyse' function run time, 'motion detected' path: ", str(analysisStopTime - analysisStartTime))
+#            print("'analyse' function run time, 'motion detected' path, ns: ", str(analysisStopTime - analysisStartTime))
 #            print('motion with amplitude ' + str(motionEstimate) + ' was detected at time ' + str(motionDetectionTime) + ' in frame ' + str(currentFrame))
-#            print('MAX element indices for Xabs, Yabs: ', str(indexMaxXabs), ', ', str(indexMaxYabs))
 #            print('MAX Xabs element row, column: ', rowForMaxXabs, ', ', columnForMaxXabs)
 #            print('MAX Yabs element row, column: ', rowForMaxYabs, ', ', columnForMaxYabs)
 
         currentFrame += 1
 
+    # The NumPy version of the 'analyse' computations (see above)
+    # for the '_batchSize' frames in the '_batch' array.
+    # Note that the results of a frame are stored when its batch is complete,
+    # i.e. up to 'analysisBatchSize' frames later than it was received
+    # (the motion detection times are the times the frames were received at).
+    def _analyse_batch(self):
+
+        global currentFrame, motionDetectionCount
+
+        n = self._batchSize
+        batch = self._batch[:n]
+        xyabs = self._xyabs[:n]
+
+#sSAD:
+        # The 'sum' method of the array skips the argument handling of the 'np.sum' function.
+        # 'uint32' is wide enough for 'sSAD' (at most 45*81*65535 for the 1280x720 frame size).
+        sSADs[currentFrame - 1:currentFrame - 1 + n] = batch['sad'].sum(axis = 1, dtype = np.uint32)
+
+#MOTION:
+        # Calculate the absolute values of the X-axis and
+        # Y-axis motion vector components
+        # (the x and y bytes of each element, viewed as an n x 2 x 'rows*columnsPerRow' array):
+        mvd = batch.view(np.int8).reshape(n, -1, 4)
+        np.absolute(mvd[:, :, :2].transpose(0, 2, 1), out = xyabs, casting = 'unsafe')
+
+        # 'int32' accumulators are wide enough for the sums
+        # (at most 45*81*128 for the 1280x720 frame size) and narrower than
+        # the platform integer 'np.sum' would otherwise accumulate into.
+        batchMotionEstimates = xyabs.sum(axis = 2, dtype = np.int32).sum(axis = 1)
+        motionEstimates[currentFrame - 1:currentFrame - 1 + n] = batchMotionEstimates
+
+        detected = np.flatnonzero(batchMotionEstimates > motionDetectionThreshold)
+        if len(detected) > 0:
+            d = len(detected)
+            motionDetectionTimes[motionDetectionCount:motionDetectionCount + d] = self._batchTimes[detected]
+            motionDetectionFrameNumbers[motionDetectionCount:motionDetectionCount + d] = currentFrame + detected
+            motionDetectionCount += d
+
+            # The absolute values computed for the sums above are reused,
+            # and a single 'np.argmax' call finds the positions of the largest
+            # X-axis and Y-axis motion vector components in all the frames
+            # with detected motion: (row, column) = (rowsForMax[k, 0], columnsForMax[k, 0])
+            # for the X-axis component in the k-th of these frames,
+            # (rowsForMax[k, 1], columnsForMax[k, 1]) for the Y-axis one.
+            rowsForMax, columnsForMax = np.divmod(np.argmax(xyabs[detected], axis = 2), columnsPerRow)
+
+# Uncomment for test purposes only!
+#            for k in range(d):
+#                print('MAX Xabs element row, column: ', rowsForMax[k, 0], ', ', columnsForMax[k, 0])
+#                print('MAX Yabs element row, column: ', rowsForMax[k, 1], ', ', columnsForMax[k, 1])
+
+        currentFrame += n
+        self._batchSize = 0
+
+    # Analyses the frames remaining in the '_batch' array
+    # (called after the end of each time slice, see below).
+    def flush(self):
+
+        if self._batchSize > 0:
+            self._analyse_batch()
+        super(mmotion, self).flush()
+
+    # Runs the 'analyse' computations of the active version once on
+    # a dummy (all zeros) motion vector data array, discarding the results
+    # (called before the start of each time slice, see below).
+    # This compiles (or loads from the cache) the Numba functions when called
+    # for the first time and brings the functions and the arrays they use
+    # back into the CPU caches after the pause between the time slices,
+    # so that the first frames of a time slice are not analysed slower than the others.
+    def prepare(self):
+
+        # A read-only array, as the ones picamera passes to the 'analyse' method
+        # (Numba compiles separate versions of the functions for read-only arrays).
+        dummy = np.frombuffer(bytes(rows*columnsPerRow*4), dtype = picamera.array.motion_dtype).reshape((rows, columnsPerRow))
+
+        if _ckernel is not None:
+            _ckernel.altmotion_analyse(dummy.ctypes.data, dummy.size, self._sumsAddress)
+            _ckernel.altmotion_locate(dummy.ctypes.data, dummy.size, columnsPerRow, self._positionsAddress)
+        elif _analyse_kernel is not None:
+            mvd, sad = _mvdViews(dummy)
+            _analyse_kernel(mvd, sad)
+            _locate_kernel(mvd, columnsPerRow)
+        else:
+            self._batch[:] = dummy.reshape(-1)
+            self._batchTimes.fill(0)
+            mvd = self._batch.view(np.int8).reshape(analysisBatchSize, -1, 4)
+            np.absolute(mvd[:, :, :2].transpose(0, 2, 1), out = self._xyabs, casting = 'unsafe')
+            self._xyabs.sum(axis = 2, dtype = np.int32).sum(axis = 1)
+            self._batch['sad'].sum(axis = 1, dtype = np.uint32)
+            np.argmax(self._xyabs, axis = 2)
+
+        self._batchSize = 0
+
+
+# Saving the data of a time slice into files takes time, during which the next
+# time slice could already be recorded.
+# The main thread therefore puts the data of each time slice into the 'dataQueue'
+# (see below) and the '_writer_loop' function, running in a separate thread,
+# saves them into files.
+# The queue holds at most two time slices: if saving falls behind,
+# the main thread waits before starting a new time slice instead of
+# accumulating the data in memory.
+# The data are saved in the binary NumPy '.npy' format
+# (https://numpy.org/doc/stable/reference/generated/numpy.lib.format.html):
+# a short header describing the data type and the number of values,
+# followed by the values themselves, 4 bytes per frame for the 'sSAD'
+# and the 'motionEstimate' values. Nothing is converted to text.
+# See the 'ALTmotion - load data.py' script for loading the data
+# (and saving them into text files, as earlier versions of this script did).
+motionDetectionDtype = np.dtype([('frame', '<i4'), ('time', '<i8')]) # frame number, time (ns since the epoch)
+
+def _writer_loop(dataQueue):
+
+    while True:
+        timeSliceDir, sSADs, motionEstimates, motionDetectionFrameNumbers, motionDetectionTimes = dataQueue.get()
+
+        try:
+#sSAD:
+            np.save(timeSliceDir + 'SADs.npy', sSADs.astype('<u4', copy = False))
+
+#MOTION:
+            np.save(timeSliceDir + 'motionEstimate.npy', motionEstimates.astype('<u4', copy = False))
+
+            motionDetections = np.empty(len(motionDetectionTimes), dtype = motionDetectionDtype)
+            motionDetections['frame'] = motionDetectionFrameNumbers
+            motionDetections['time'] = motionDetectionTimes
+            np.save(timeSliceDir + 'motion detection times.npy', motionDetections)
+
+        except Exception as e:
+            print('Saving data into ', timeSliceDir, ' failed: ', e)
+
+        dataQueue.task_done()
+
+dataQueue = queue.Queue(maxsize = 2)
+threading.Thread(target = _writer_loop, args = (dataQueue,), daemon = True).start()
 
 # The relevant sections of the 'picamera' library documentation
 # for the following sections of the code are:
@@ -268,6 +584,10 @@ with picamera.PiCamera() as camera:
         print("'camera.awb_gains' set before recording: ", g)
         print("'camera.analog_gain' value before recording: ", camera.analog_gain)        
 
+        # The first call can take a few seconds (see the 'prepare' method above),
+        # so it is made here rather than right before the first time slice.
+        mvdOutput.prepare()
+
         print('10 ...')
         time.sleep(5)
         print('5 ...')
@@ -283,44 +603,51 @@ with picamera.PiCamera() as camera:
             print('timeSliceDir = ', timeSliceDir)
             os.makedirs(timeSliceDir)
 
+            # The arrays below are filled in by the 'analyse' method, one element per frame
+            # (or per detected motion), instead of growing Python lists frame by frame.
+            # They are allocated for 10% more frames than the 'camera.framerate'
+            # setting gives for a time slice.
+            maxFrames = int(timeSliceDurationMinutes*60*camera.framerate*1.1)
+
 #sSAD:
-            sSADs = []
-            sSADsfile = open(timeSliceDir + 'SADs.txt', 'w')
+            sSADs = np.empty(maxFrames, dtype = np.uint32)
 
 #MOTION:
-            motionEstimates = []
-            motionDetectionTimes = []
-            motionDetectionFrameNumbers = []
+            motionEstimates = np.empty(maxFrames, dtype = np.uint32)
+            motionDetectionTimes = np.empty(maxFrames, dtype = np.int64) # ns since the epoch
+            motionDetectionFrameNumbers = np.empty(maxFrames, dtype = np.int32)
             currentFrame = 1
-            motionEstimateFile = open(timeSliceDir + 'motionEstimate.txt', 'w')
-            motionDetectionTimesFile = open(timeSliceDir + 'motion detection times.txt', 'w')
+            motionDetectionCount = 0
 
 #RECORDING:
             # Note that the 'quality' parameter of the 'start_recording()' method
             # might be useful to keep the size of the captured video files reasonably low.
             # See https://picamera.readthedocs.io/en/release-1.13/api_camera.html#picamera.PiCamera.start_recording
             # for details.
-            camera.start_recording(timeSliceDir + '1280x720.h264', format = 'h264', motion_output = mvdOutput, quality = 40)
+            # The video is written through a 1 MB buffer (instead of the 64 KB one
+            # picamera uses for a file name), so that the SD card gets fewer, larger writes.
+            # The 'posix_fadvise' call tells the kernel the file is written sequentially.
+            videoFile = open(timeSliceDir + '1280x720.h264', 'wb', buffering = 1 << 20)
+            os.posix_fadvise(videoFile.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            mvdOutput.prepare() # The same 'mvdOutput' is used for all the time slices.
+            camera.start_recording(videoFile, format = 'h264', motion_output = mvdOutput, quality = 40)
             camera.wait_recording(timeSliceDurationMinutes*60)
             camera.stop_recording()
+            mvdOutput.flush()
+            videoFile.close() # picamera does not close the file objects it did not open.
 
-            # Note that saving data into files and stopping/restarting video recording will cause
+            # Note that stopping/restarting video recording will cause
             # a short time "gap" between the consecutive "time slices".
-#sSAD:
-            for i in range(len(sSADs)):
-                sSADsfile.write(str(i + 1) + ": " + str(sSADs[i]) + "\n")
-
-#MOTION:
-            for i in range(len(motionEstimates)):
-                motionEstimateFile.write(str(i + 1) + ": " + str(motionEstimates[i]) + "\n")
-
-            for i in range(len(motionDetectionTimes)):
-                motionDetectionTimesFile.write(str(motionDetectionFrameNumbers[i]) + ': ' + str(motionDetectionTimes[i]) + "\n") # frame number: time
-
-
-            sSADsfile.close()
-            motionEstimateFile.close()
-            motionDetectionTimesFile.close()
+            # The data are saved into files by the '_writer_loop' function (see above).
+            # New arrays are allocated for each time slice, so the arrays put into
+            # the 'dataQueue' are not modified while they are being saved.
+            dataQueue.put((timeSliceDir,
+                           sSADs[:currentFrame - 1],
+                           motionEstimates[:currentFrame - 1],
+                           motionDetectionFrameNumbers[:motionDetectionCount],
+                           motionDetectionTimes[:motionDetectionCount]))
+
+        dataQueue.join() # Wait until the data of all time slices are saved.
 
         print("'camera.shutter_speed' after the end of recording: ", camera.shutter_speed)
         print("'camera.awb_gains' after the end of recording: ", camera.awb_gains)
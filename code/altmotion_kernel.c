@@ -0,0 +1,174 @@
+// Optional C implementation of the 'analyse' computations of the
+// "ALTmotion - ver. 0.1.py" script, for Raspberry Pi 3B (ARM Cortex-A53 with NEON).
+// The script loads it with 'ctypes' when the 'altmotion_kernel.so' file
+// is found next to the script, and falls back to Numba / NumPy otherwise.
+//
+// Build it on the Raspberry Pi with
+// (32-bit Raspbian / Raspberry Pi OS):
+//   gcc -O3 -mcpu=cortex-a53 -mfpu=neon-fp-armv8 -mfloat-abi=hard -ftree-vectorize -shared -fPIC -o altmotion_kernel.so altmotion_kernel.c
+// (64-bit Raspberry Pi OS):
+//   gcc -O3 -mcpu=cortex-a53 -ftree-vectorize -shared -fPIC -o altmotion_kernel.so altmotion_kernel.c
+//
+// 'mvd' points to the motion vector data array of 'n' elements (macro-blocks).
+// "Motion data values are 4-bytes long, consisting of
+// a signed 1-byte x vector, a signed 1-byte y vector,
+// and an unsigned 2-byte SAD (Sum of Absolute Differences) value for each macro-block"
+// (https://picamera.readthedocs.io/en/release-1.13/recipes2.html#recording-motion-vector-data).
+
+#include <stddef.h>
+#include <stdint.h>
+
+#if defined(__ARM_NEON) || defined(__ARM_NEON__)
+#include <arm_neon.h>
+
+static uint32_t sum_u32x4(uint32x4_t v)
+{
+    uint64x2_t pairs = vpaddlq_u32(v);
+    return (uint32_t)(vgetq_lane_u64(pairs, 0) + vgetq_lane_u64(pairs, 1));
+}
+
+static int max_u8x16(uint8x16_t v)
+{
+    uint8x8_t m = vpmax_u8(vget_low_u8(v), vget_high_u8(v));
+    m = vpmax_u8(m, m);
+    m = vpmax_u8(m, m);
+    m = vpmax_u8(m, m);
+    return vget_lane_u8(m, 0);
+}
+
+// The absolute values are taken as signed bytes and used as unsigned ones
+// (the absolute value of -128 is 0x80, i.e. 128 as an unsigned byte).
+static uint8x16_t abs_u8x16(uint8x16_t v)
+{
+    return vreinterpretq_u8_s8(vabsq_s8(vreinterpretq_s8_u8(v)));
+}
+#endif
+
+static int abs_s8(uint8_t b)
+{
+    int v = (int8_t)b;
+    return v < 0 ? -v : v;
+}
+
+static inline __attribute__((always_inline))
+void analyse(const uint8_t *mvd, size_t n, uint32_t *sums)
+{
+    uint32_t sSAD = 0;
+    uint32_t XabsSum = 0;
+    uint32_t YabsSum = 0;
+    size_t i = 0;
+
+#if defined(__ARM_NEON) || defined(__ARM_NEON__)
+    // 16 macro-blocks per iteration: 'vld4q_u8' loads 64 bytes and splits them
+    // into the x, y, SAD low byte and SAD high byte vectors.
+    // The values are accumulated widening pairwise into 32-bit lanes.
+    uint32x4_t XabsAcc = vdupq_n_u32(0);
+    uint32x4_t YabsAcc = vdupq_n_u32(0);
+    uint32x4_t sadLowAcc = vdupq_n_u32(0);
+    uint32x4_t sadHighAcc = vdupq_n_u32(0);
+
+    for (; i + 16 <= n; i += 16) {
+        uint8x16x4_t v = vld4q_u8(mvd + 4*i);
+
+        XabsAcc = vpadalq_u16(XabsAcc, vpaddlq_u8(abs_u8x16(v.val[0])));
+        YabsAcc = vpadalq_u16(YabsAcc, vpaddlq_u8(abs_u8x16(v.val[1])));
+        sadLowAcc = vpadalq_u16(sadLowAcc, vpaddlq_u8(v.val[2]));
+        sadHighAcc = vpadalq_u16(sadHighAcc, vpaddlq_u8(v.val[3]));
+    }
+
+    sSAD = sum_u32x4(sadLowAcc) + (sum_u32x4(sadHighAcc) << 8);
+    XabsSum = sum_u32x4(XabsAcc);
+    YabsSum = sum_u32x4(YabsAcc);
+#endif
+
+    for (; i < n; i++) {
+        sSAD += mvd[4*i + 2] | (mvd[4*i + 3] << 8);
+        XabsSum += abs_s8(mvd[4*i]);
+        YabsSum += abs_s8(mvd[4*i + 1]);
+    }
+
+    sums[0] = sSAD;
+    sums[1] = XabsSum;
+    sums[2] = YabsSum;
+}
+
+// sums[0] = 'sSAD', sums[1] = 'XabsSum', sums[2] = 'YabsSum'.
+// The number of macro-blocks is fixed by the 'camera.resolution' setting
+// of the script: 45 x 81 = 3645 for 1280x720, 30 x 41 = 1230 for 640x480.
+// For these sizes (and for the one given with e.g. '-DALT_N=...' when building)
+// the 'analyse' function above is compiled with a constant 'n', which lets
+// the compiler unroll the loops and drop the remainder loop.
+void altmotion_analyse(const uint8_t *mvd, size_t n, uint32_t *sums)
+{
+    switch (n) {
+    case 3645:
+        analyse(mvd, 3645, sums);
+        break;
+    case 1230:
+        analyse(mvd, 1230, sums);
+        break;
+#if defined(ALT_N) && ALT_N != 3645 && ALT_N != 1230
+    case ALT_N:
+        analyse(mvd, ALT_N, sums);
+        break;
+#endif
+    default:
+        analyse(mvd, n, sums);
+    }
+}
+
+// Index of the first element whose absolute X-axis (offset 0) or Y-axis (offset 1)
+// motion vector component equals 'value' (which must occur in the array).
+static size_t first_index_of(const uint8_t *mvd, int offset, int value)
+{
+    size_t i = 0;
+
+    while (abs_s8(mvd[4*i + offset]) != value)
+        i++;
+    return i;
+}
+
+// positions[0], positions[1] = row, column of the element having the motion vector
+// with the largest X-axis component;
+// positions[2], positions[3] = row, column of the element having the motion vector
+// with the largest Y-axis component.
+// The largest values are found first, without branches (which the position of
+// the largest value, random from frame to frame, would make unpredictable),
+// then their first positions are found (as 'np.argmax' does).
+void altmotion_locate(const uint8_t *mvd, size_t n, size_t columnsPerRow, uint32_t *positions)
+{
+    int maxXabs = 0;
+    int maxYabs = 0;
+    size_t i = 0;
+
+#if defined(__ARM_NEON) || defined(__ARM_NEON__)
+    uint8x16_t maxXabsVec = vdupq_n_u8(0);
+    uint8x16_t maxYabsVec = vdupq_n_u8(0);
+
+    for (; i + 16 <= n; i += 16) {
+        uint8x16x4_t v = vld4q_u8(mvd + 4*i);
+
+        maxXabsVec = vmaxq_u8(maxXabsVec, abs_u8x16(v.val[0]));
+        maxYabsVec = vmaxq_u8(maxYabsVec, abs_u8x16(v.val[1]));
+    }
+
+    maxXabs = max_u8x16(maxXabsVec);
+    maxYabs = max_u8x16(maxYabsVec);
+#endif
+
+    for (; i < n; i++) {
+        int Xabs = abs_s8(mvd[4*i]);
+        int Yabs = abs_s8(mvd[4*i + 1]);
+
+        maxXabs = Xabs > maxXabs ? Xabs : maxXabs;
+        maxYabs = Yabs > maxYabs ? Yabs : maxYabs;
+    }
+
+    size_t indexMaxXabs = first_index_of(mvd, 0, maxXabs);
+    size_t indexMaxYabs = first_index_of(mvd, 1, maxYabs);
+
+    positions[0] = indexMaxXabs / columnsPerRow;
+    positions[1] = indexMaxXabs % columnsPerRow;
+    positions[2] = indexMaxYabs / columnsPerRow;
+    positions[3] = indexMaxYabs % columnsPerRow;
+}